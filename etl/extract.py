@@ -1,63 +1,180 @@
+import asyncio
+import atexit
+import hashlib
 import httpx
-import json
-from datetime import datetime, timedelta, timezone
+import orjson
+from datetime import datetime, timedelta
 import os
 from dotenv import load_dotenv
 from etl.db import get_conn
+from etl.transform import SG_TZ
 
 load_dotenv()
 
+# One pooled client for the sync extractors, so repeated fetches in a process
+# reuse connections; the transport retries failed connection attempts
+_http_client = httpx.Client(transport=httpx.HTTPTransport(retries=3))
+atexit.register(_http_client.close)
+
 def fetch_carpark_availability():
     """Fetch real-time carpark availability from HDB API"""
     url = os.getenv("HDB_CARPARK_API_URL")
     print(f"Fetching carpark availability from: {url}")
     
-    with httpx.Client() as client:
-        response = client.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        print(f"Fetched {len(data.get('items', []))} availability records")
-        return data
+    response = _http_client.get(url, timeout=30)
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    print(f"Fetched {len(data.get('items', []))} availability records")
+    return data
+
+def get_latest_availability_ingest_ts():
+    """Get when the latest loaded availability snapshot was ingested (naive SGT), or None"""
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            # The latest-availability view is small and refreshed after every load
+            cur.execute("SELECT MAX(ingest_ts_sgt) FROM mv_carpark_latest_availability")
+            return cur.fetchone()[0]
+            
+    except Exception as e:
+        print(f"Error checking latest availability snapshot: {e}")
+        return None
+
+def fetch_carpark_availability_if_stale(min_age=timedelta(seconds=90)):
+    """Fetch real-time carpark availability, or None if the loaded snapshot is newer than min_age.
+    
+    The API only publishes a new snapshot every minute or so, so reruns inside
+    that window would just download and load the same readings again.
+    """
+    latest_ingest_ts = get_latest_availability_ingest_ts()
+    if latest_ingest_ts is not None:
+        age = datetime.now(SG_TZ).replace(tzinfo=None) - latest_ingest_ts
+        if age < min_age:
+            print(f"✅ Availability snapshot loaded {age.total_seconds():.0f}s ago - skipping fetch")
+            return None
+    
+    return fetch_carpark_availability()
 
 def fetch_carpark_info():
     """Fetch HDB carpark information"""
     url = os.getenv("HDB_CARPARK_INFO_URL")
     print(f"Fetching carpark info from: {url}")
     
-    with httpx.Client() as client:
-        response = client.get(url, timeout=30)
-        response.raise_for_status()
-        data = response.json()
-        records = data.get('result', {}).get('records', [])
-        print(f"Fetched {len(records)} carpark info records")
-        return data
+    response = _http_client.get(url, timeout=30)
+    response.raise_for_status()
+    data = orjson.loads(response.content)
+    records = data.get('result', {}).get('records', [])
+    print(f"Fetched {len(records)} carpark info records")
+    return data
 
-def get_existing_historical_dates():
-    """Get dates that already exist in the historical database table"""
+CARPARK_INFO_SOURCE = 'carpark_info'
+
+def get_carpark_info_sync_state():
+    """Get the ETag and content hash of the loaded carpark info, if it is still in the table"""
     try:
         with get_conn() as conn:
             cur = conn.cursor()
-            # Get distinct dates from existing historical data (extract date from timestamp)
             cur.execute("""
-                SELECT DISTINCT DATE(update_datetime_sg) as existing_date
-                FROM raw_carpark_availability_6pm_last_30days
-                WHERE update_datetime_sg IS NOT NULL
-                ORDER BY existing_date DESC
-            """)
+                SELECT etag, content_hash
+                FROM etl_sync_state
+                WHERE source = %s
+                  AND EXISTS (SELECT 1 FROM ref_carpark_info)
+            """, (CARPARK_INFO_SOURCE,))
+            row = cur.fetchone()
+            return {'etag': row[0], 'content_hash': row[1]} if row else None
             
-            existing_dates = {row[0] for row in cur.fetchall()}
-            print(f"Found {len(existing_dates)} existing historical dates in database")
+    except Exception as e:
+        print(f"Error checking carpark info sync state: {e}")
+        return None
+
+def fetch_carpark_info_if_changed():
+    """Fetch HDB carpark information unless it is unchanged since the last load.
+    
+    Returns (data, sync_state): sync_state is stored with the load so the next
+    run can skip it. Returns (None, None) when the loaded copy is current.
+    """
+    url = os.getenv("HDB_CARPARK_INFO_URL")
+    print(f"Fetching carpark info (if changed) from: {url}")
+    
+    last_state = get_carpark_info_sync_state()
+    headers = {'If-None-Match': last_state['etag']} if last_state and last_state['etag'] else {}
+    response = _http_client.get(url, headers=headers, timeout=30)
+    if response.status_code == 304:
+        print("✅ Carpark info not modified since last load")
+        return None, None
+    response.raise_for_status()
+    
+    # Not every endpoint sends an ETag, so the body is compared as well
+    content_hash = hashlib.sha256(response.content).hexdigest()
+    if last_state and last_state['content_hash'] == content_hash:
+        print("✅ Carpark info unchanged since last load")
+        return None, None
+    
+    data = orjson.loads(response.content)
+    records = data.get('result', {}).get('records', [])
+    print(f"Fetched {len(records)} carpark info records")
+    sync_state = {
+        'source': CARPARK_INFO_SOURCE,
+        'etag': response.headers.get('ETag'),
+        'content_hash': content_hash,
+    }
+    return data, sync_state
+
+def get_missing_historical_dates(first_date, last_date):
+    """Get dates from last_date back to first_date that have no rows in the historical table"""
+    try:
+        with get_conn() as conn:
+            cur = conn.cursor()
+            # Anti-join the calendar against the table in the database: one range
+            # probe on the primary key per day, and only missing dates come back
+            cur.execute("""
+                SELECT day::date as missing_date
+                FROM generate_series(%s::timestamp, %s::timestamp, INTERVAL '1 day') AS day
+                WHERE NOT EXISTS (
+                    SELECT 1
+                    FROM raw_carpark_availability_6pm_last_30days
+                    WHERE update_datetime_sg >= day
+                      AND update_datetime_sg < day + INTERVAL '1 day'
+                )
+                ORDER BY day DESC
+            """, (first_date, last_date))
             
-            if existing_dates:
-                latest_date = max(existing_dates)
-                earliest_date = min(existing_dates)
-                print(f"  Date range: {earliest_date} to {latest_date}")
+            missing_dates = [row[0] for row in cur.fetchall()]
+            print(f"Found {len(missing_dates)} dates missing from the historical database table")
             
-            return existing_dates
+            return missing_dates
             
     except Exception as e:
-        print(f"Error checking existing historical dates: {e}")
-        return set()
+        print(f"Error checking missing historical dates: {e}")
+        days = (last_date - first_date).days
+        return [last_date - timedelta(days=days_back) for days_back in range(days + 1)]
+
+def _6pm_datetime_param(target_date):
+    """Format 6pm SGT on a date for the API (YYYY-MM-DDTHH:MM:SS, API expects SGT directly)"""
+    return target_date.isoformat() + 'T18:00:00'
+
+async def _fetch_6pm_items_for_date(client, url, target_date):
+    """Fetch the availability items for 6pm SGT on a single date"""
+    params = {"date_time": _6pm_datetime_param(target_date)}
+    response = await client.get(url, params=params, timeout=30)
+    response.raise_for_status()
+    return orjson.loads(response.content).get('items', [])
+
+async def _fetch_6pm_items(url, dates, max_connections=10):
+    """Fetch 6pm items for all dates concurrently over one pooled client.
+    
+    Returns one entry per date, in order: the list of items, or the
+    exception raised while fetching that date.
+    """
+    # Limits go on the transport: a client given its own transport ignores them
+    transport = httpx.AsyncHTTPTransport(
+        retries=3, limits=httpx.Limits(max_connections=max_connections)
+    )
+    async with httpx.AsyncClient(transport=transport) as client:
+        return await asyncio.gather(
+            *(_fetch_6pm_items_for_date(client, url, d) for d in dates),
+            return_exceptions=True
+        )
 
 def fetch_carpark_availability_6pm_historical():
     """Fetch historical carpark availability for 6pm analysis (delta loading)"""
@@ -65,56 +182,33 @@ def fetch_carpark_availability_6pm_historical():
     print(f"Fetching historical 6pm carpark availability data with delta loading...")
     
     # Use Singapore timezone for date calculations
-    singapore_tz = timezone(timedelta(hours=8))
-    today = datetime.now(singapore_tz)
-    
-    # Get existing dates from database
-    existing_dates = get_existing_historical_dates()
+    today = datetime.now(SG_TZ).date()
     
-    # Determine which dates we need to fetch
-    dates_to_fetch = []
-    for days_back in range(1, 31):
-        target_date = today - timedelta(days=days_back)
-        target_date_only = target_date.date()
-        
-        if target_date_only not in existing_dates:
-            dates_to_fetch.append(target_date)
+    # Determine which of the last 30 days are not in the database yet
+    dates_to_fetch = get_missing_historical_dates(today - timedelta(days=30), today - timedelta(days=1))
     
     if not dates_to_fetch:
         print("✅ All historical data up to date - no new dates to fetch")
         return {"items": []}
     
     print(f"📥 Need to fetch {len(dates_to_fetch)} missing dates out of 30 days")
-    print(f"📅 Date range to fetch: {min(d.date() for d in dates_to_fetch)} to {max(d.date() for d in dates_to_fetch)}")
+    print(f"📅 Date range to fetch: {min(dates_to_fetch)} to {max(dates_to_fetch)}")
     
     all_records = []
     successful_fetches = 0
     
-    for target_date in dates_to_fetch:
-        # Set to 6pm Singapore time
-        target_datetime = target_date.replace(hour=18, minute=0, second=0, microsecond=0)
-        
-        # Format datetime for API (YYYY-MM-DDTHH:MM:SS format) - API expects SGT directly
-        datetime_param = target_datetime.strftime('%Y-%m-%dT%H:%M:%S')
-        
-        try:
-            with httpx.Client() as client:
-                params = {"date_time": datetime_param}
-                response = client.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                
-                items = data.get('items', [])
-                if items:
-                    print(f"  ✅ Fetched {len(items)} records for {target_date.strftime('%Y-%m-%d')} 6pm SGT")
-                    all_records.extend(items)
-                    successful_fetches += 1
-                else:
-                    print(f"  ⚠️  No data available for {target_date.strftime('%Y-%m-%d')} 6pm SGT")
-                    
-        except Exception as e:
-            print(f"  ❌ Error fetching data for {target_date.strftime('%Y-%m-%d')}: {e}")
-            continue
+    # The per-date requests are independent, so issue them concurrently
+    results = asyncio.run(_fetch_6pm_items(url, dates_to_fetch))
+    
+    for target_date, result in zip(dates_to_fetch, results):
+        if isinstance(result, Exception):
+            print(f"  ❌ Error fetching data for {target_date}: {result}")
+        elif result:
+            print(f"  ✅ Fetched {len(result)} records for {target_date} 6pm SGT")
+            all_records.extend(result)
+            successful_fetches += 1
+        else:
+            print(f"  ⚠️  No data available for {target_date} 6pm SGT")
     
     print(f"📊 Delta fetch summary:")
     print(f"  - Total dates needed: {len(dates_to_fetch)}")
@@ -130,33 +224,22 @@ def fetch_carpark_availability_6pm_historical_full():
     print(f"Fetching FULL historical 6pm carpark availability data (30 days)...")
     
     all_records = []
-    singapore_tz = timezone(timedelta(hours=8))
-    today = datetime.now(singapore_tz)
-    
-    print(f"📅 Today's date in Singapore: {today.strftime('%Y-%m-%d')}")
-    
-    for days_back in range(1, 31):
-        target_date = today - timedelta(days=days_back)
-        target_datetime = target_date.replace(hour=18, minute=0, second=0, microsecond=0)
-        datetime_param = target_datetime.strftime('%Y-%m-%dT%H:%M:%S')
-        
-        try:
-            with httpx.Client() as client:
-                params = {"date_time": datetime_param}
-                response = client.get(url, params=params, timeout=30)
-                response.raise_for_status()
-                data = response.json()
-                
-                items = data.get('items', [])
-                if items:
-                    print(f"  ✅ Fetched {len(items)} records for {target_date.strftime('%Y-%m-%d')} 6pm SGT")
-                    all_records.extend(items)
-                else:
-                    print(f"  ⚠️  No data available for {target_date.strftime('%Y-%m-%d')} 6pm SGT")
-                    
-        except Exception as e:
-            print(f"  ❌ Error fetching data for {target_date.strftime('%Y-%m-%d')}: {e}")
-            continue
+    today = datetime.now(SG_TZ).date()
+    
+    print(f"📅 Today's date in Singapore: {today}")
+    
+    # Fetch all 30 dates concurrently over the same pooled client as the delta path
+    dates_to_fetch = [today - timedelta(days=days_back) for days_back in range(1, 31)]
+    results = asyncio.run(_fetch_6pm_items(url, dates_to_fetch))
+    
+    for target_date, result in zip(dates_to_fetch, results):
+        if isinstance(result, Exception):
+            print(f"  ❌ Error fetching data for {target_date}: {result}")
+        elif result:
+            print(f"  ✅ Fetched {len(result)} records for {target_date} 6pm SGT")
+            all_records.extend(result)
+        else:
+            print(f"  ⚠️  No data available for {target_date} 6pm SGT")
     
     print(f"📊 Full fetch completed: {len(all_records)} total records")
     return {"items": all_records}
\ No newline at end of file
@@ -1,48 +1,110 @@
 from etl.db import get_conn
+from etl.transform import SG_TZ
 import pandas as pd
-from datetime import datetime, date
-import json
-import warnings
-warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
+from datetime import datetime, timedelta
+import io
+
+# Columns of both availability tables, in insert order, and the transform
+# frame columns that feed them (payload_json is already JSON text)
+AVAILABILITY_COLUMNS = (
+    'ingest_ts_sgt', 'carpark_number', 'total_lots', 'lot_type',
+    'available_lots', 'update_datetime_sg', 'payload_json'
+)
+_AVAILABILITY_FIELDS = [
+    'ingest_ts_utc', 'carpark_number', 'total_lots', 'lot_type',
+    'available_lots', 'update_datetime_sg', 'payload_json'
+]
+
+# The current table keeps every column but the payload, which goes to
+# raw_carpark_current_payload once per carpark snapshot
+CURRENT_PAYLOAD_COLUMNS = ('ingest_ts_sgt', 'carpark_number', 'update_datetime_sg', 'payload_json')
+_CURRENT_PAYLOAD_FIELDS = ['ingest_ts_utc', 'carpark_number', 'update_datetime_sg', 'payload_json']
+
+def _copy_frame(cur, table, columns, df):
+    """Stream a DataFrame into a table with COPY FROM STDIN (CSV format).
+    
+    Missing values are written as \\N so they load as NULL while empty
+    strings stay empty strings, as they would with a plain INSERT.
+    """
+    buf = io.StringIO()
+    df.to_csv(buf, header=False, index=False, na_rep='\\N')
+    buf.seek(0)
+    cur.copy_expert(
+        f"COPY {table} ({', '.join(columns)}) FROM STDIN WITH (FORMAT csv, NULL '\\N')", buf
+    )
+
+def _valid_availability_rows(df):
+    """Drop rows that would violate NOT NULL columns, reporting how many were skipped"""
+    valid = df[
+        df['carpark_number'].notna() & (df['carpark_number'] != '')
+        & df['payload_json'].notna()
+    ]
+    skipped = len(df) - len(valid)
+    if skipped:
+        print(f"Skipping {skipped} records without carpark_number or payload")
+    return valid[_AVAILABILITY_FIELDS]
+
+_STAGE_SQL_CURRENT_PAYLOAD = """
+    CREATE TEMP TABLE tmp_carpark_current_payload
+    (LIKE raw_carpark_current_payload INCLUDING DEFAULTS)
+    ON COMMIT DROP
+"""
+
+# A snapshot the API still reports on the next run keeps its first payload
+_INSERT_SQL_CURRENT_PAYLOAD = """
+    INSERT INTO raw_carpark_current_payload
+    (ingest_ts_sgt, carpark_number, update_datetime_sg, payload_json)
+    SELECT ingest_ts_sgt, carpark_number, update_datetime_sg, payload_json
+    FROM tmp_carpark_current_payload
+    ON CONFLICT (carpark_number, update_datetime_sg) DO NOTHING
+"""
 
 def load_carpark_current_availability(records):
-    """Load carpark availability data to database"""
-    if not records:
+    """Load a transformed carpark availability DataFrame to the database"""
+    if records.empty:
         print("No availability records to load")
         return
     
+    rows = _valid_availability_rows(records)
+    # Lot-type rows of one carpark snapshot share a single payload
+    payloads = rows.drop_duplicates(subset=['carpark_number', 'update_datetime_sg'])
+    
     with get_conn() as conn:
         cur = conn.cursor()
         
-        loaded_count = 0
-        for record in records:
-            try:
-                cur.execute("""
-                    INSERT INTO raw_carpark_current_availability 
-                    (ingest_ts_sgt, carpark_number, total_lots, lot_type, 
-                     available_lots, update_datetime_sg, payload_json)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    record['ingest_ts_utc'],
-                    record['carpark_number'],
-                    record['total_lots'],
-                    record['lot_type'],
-                    record['available_lots'],
-                    record['update_datetime_sg'],
-                    json.dumps(record['payload_json'])
-                ))
-                loaded_count += 1
-            except Exception as e:
-                print(f"Error loading record {record.get('carpark_number')}: {e}")
-                continue
+        # Stream the batch with COPY instead of building INSERT ... VALUES pages
+        _copy_frame(cur, "raw_carpark_current_availability", AVAILABILITY_COLUMNS[:-1], rows[_AVAILABILITY_FIELDS[:-1]])
         
-        print(f"Loaded {loaded_count} availability records")
+        # Payloads go through a staging table so snapshots already stored are skipped
+        cur.execute(_STAGE_SQL_CURRENT_PAYLOAD)
+        _copy_frame(cur, "tmp_carpark_current_payload", CURRENT_PAYLOAD_COLUMNS, payloads[_CURRENT_PAYLOAD_FIELDS])
+        cur.execute(_INSERT_SQL_CURRENT_PAYLOAD)
+        
+        print(f"Loaded {len(rows)} availability records ({cur.rowcount} new carpark payloads)")
+
+REF_CARPARK_INFO_COLUMNS = (
+    'car_park_no', 'address', 'x_coord', 'y_coord', 'car_park_type',
+    'type_of_parking_system', 'short_term_parking', 'free_parking',
+    'night_parking', 'car_park_decks', 'gantry_height', 'car_park_basement'
+)
 
-def load_carpark_info(records):
-    """Load carpark reference data"""
+_SAVE_SYNC_STATE_SQL = """
+    INSERT INTO etl_sync_state (source, etag, content_hash, updated_at)
+    VALUES (%s, %s, %s, now())
+    ON CONFLICT (source) DO UPDATE SET
+        etag = EXCLUDED.etag,
+        content_hash = EXCLUDED.content_hash,
+        updated_at = EXCLUDED.updated_at
+"""
+
+def load_carpark_info(records, sync_state=None):
+    """Load carpark reference data, recording the source's sync state in the same transaction"""
     if not records:
         print("No carpark info records to load")
-        return
+        return 0
+    
+    # API fields map 1:1 onto the table columns; missing fields load as NULL
+    rows = pd.DataFrame.from_records(records, columns=REF_CARPARK_INFO_COLUMNS)
     
     with get_conn() as conn:
         cur = conn.cursor()
@@ -50,140 +112,81 @@ def load_carpark_info(records):
         # Clear existing data first
         cur.execute("TRUNCATE TABLE ref_carpark_info")
         
-        loaded_count = 0
-        for record in records:
-            try:
-                cur.execute("""
-                    INSERT INTO ref_carpark_info 
-                    (car_park_no, address, x_coord, y_coord, car_park_type,
-                     type_of_parking_system, short_term_parking, free_parking, 
-                     night_parking, car_park_decks, gantry_height, car_park_basement)
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)
-                """, (
-                    record.get('car_park_no'),
-                    record.get('address'),
-                    record.get('x_coord'),
-                    record.get('y_coord'),
-                    record.get('car_park_type'),
-                    record.get('type_of_parking_system'),
-                    record.get('short_term_parking'),
-                    record.get('free_parking'),
-                    record.get('night_parking'),
-                    record.get('car_park_decks'),
-                    record.get('gantry_height'),
-                    record.get('car_park_basement')
-                ))
-                loaded_count += 1
-            except Exception as e:
-                print(f"Error loading carpark info {record.get('car_park_no')}: {e}")
-                continue
+        _copy_frame(cur, "ref_carpark_info", REF_CARPARK_INFO_COLUMNS, rows)
+        
+        if sync_state:
+            cur.execute(_SAVE_SYNC_STATE_SQL, (
+                sync_state['source'], sync_state['etag'], sync_state['content_hash']
+            ))
         
-        print(f"Loaded {loaded_count} carpark info records")
+        print(f"Loaded {len(rows)} carpark info records")
+        return len(rows)
 
-def load_carpark_availability_6pm_last_30days(records, clear_existing=False):
+_STAGE_SQL_6PM = """
+    CREATE TEMP TABLE tmp_carpark_availability_6pm
+    (LIKE raw_carpark_availability_6pm_last_30days INCLUDING DEFAULTS)
+    ON COMMIT DROP
+"""
+
+# Re-ingesting an unchanged day skips the UPDATE (and its WAL/TOAST writes)
+_UPSERT_SQL_6PM = """
+    INSERT INTO raw_carpark_availability_6pm_last_30days AS hist
+    (ingest_ts_sgt, carpark_number, total_lots, lot_type, 
+     available_lots, update_datetime_sg, payload_json)
+    SELECT ingest_ts_sgt, carpark_number, total_lots, lot_type,
+           available_lots, update_datetime_sg, payload_json
+    FROM tmp_carpark_availability_6pm
+    ON CONFLICT (update_datetime_sg, carpark_number) DO UPDATE SET
+    ingest_ts_sgt = EXCLUDED.ingest_ts_sgt,
+    total_lots = EXCLUDED.total_lots,
+    available_lots = EXCLUDED.available_lots,
+    lot_type = EXCLUDED.lot_type,
+    payload_json = EXCLUDED.payload_json
+    WHERE (hist.total_lots, hist.available_lots, hist.lot_type, hist.payload_json)
+          IS DISTINCT FROM
+          (EXCLUDED.total_lots, EXCLUDED.available_lots, EXCLUDED.lot_type, EXCLUDED.payload_json)
+"""
+
+def load_carpark_availability_6pm_last_30days(records):
     """
-    Load historical 6pm carpark availability data to database
+    Upsert historical 6pm carpark availability data to database
     
     Args:
-        records: List of records to load
-        clear_existing: If True, truncate table before loading (for full refresh)
-                       If False, use delta loading with ON CONFLICT handling
+        records: DataFrame of transformed records to load
+    
+    Returns:
+        Number of rows inserted or changed
     """
-    if not records:
+    if records.empty:
         print("No 6pm historical records to load")
-        return
+        return 0
+    
+    # The table is keyed on (update_datetime_sg, carpark_number), so keep the
+    # last record per key like the row-by-row upsert used to
+    rows = _valid_availability_rows(records).drop_duplicates(
+        subset=['update_datetime_sg', 'carpark_number'], keep='last'
+    )
     
     with get_conn() as conn:
         cur = conn.cursor()
         
-        if clear_existing:
-            # Full refresh mode - clear existing data
-            print("🔍 DEBUG: About to execute TRUNCATE...")
-            cur.execute("TRUNCATE TABLE raw_carpark_availability_6pm_last_30days")
-            print("🔍 DEBUG: TRUNCATE executed successfully")
-            print("🗑️  Cleared existing 6pm historical data (full refresh mode)")
-            
-            # Check if table is actually empty
-            cur.execute("SELECT COUNT(*) FROM raw_carpark_availability_6pm_last_30days")
-            count = cur.fetchone()[0]
-            print(f"🔍 DEBUG: Table now has {count} records")
-        else:
-            # Delta loading mode - use upsert
-            print("⚡ Using delta loading mode (incremental updates)")
+        # Historical rows can always be re-fetched from the API, so don't wait on
+        # the WAL flush at commit
+        cur.execute("SET LOCAL synchronous_commit = off")
         
-        loaded_count = 0
-        error_count = 0
+        # COPY into a staging table, then upsert
+        cur.execute(_STAGE_SQL_6PM)
+        _copy_frame(cur, "tmp_carpark_availability_6pm", AVAILABILITY_COLUMNS, rows)
+        cur.execute(_UPSERT_SQL_6PM)
         
-        for record in records:
-            try:
-                if clear_existing:
-                    # Use upsert even for full refresh to handle duplicates
-                    cur.execute("""
-                        INSERT INTO raw_carpark_availability_6pm_last_30days 
-                        (ingest_ts_sgt, carpark_number, total_lots, lot_type, 
-                         available_lots, update_datetime_sg, payload_json)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (update_datetime_sg, carpark_number) DO UPDATE SET
-                        ingest_ts_sgt = EXCLUDED.ingest_ts_sgt,
-                        total_lots = EXCLUDED.total_lots,
-                        available_lots = EXCLUDED.available_lots,
-                        lot_type = EXCLUDED.lot_type,
-                        payload_json = EXCLUDED.payload_json
-                    """, (
-                        record['ingest_ts_utc'],
-                        record['carpark_number'],
-                        record['total_lots'],
-                        record['lot_type'],
-                        record['available_lots'],
-                        record['update_datetime_sg'],
-                        json.dumps(record['payload_json'])
-                    ))
-                else:
-                    # Upsert for delta loading
-                    cur.execute("""
-                        INSERT INTO raw_carpark_availability_6pm_last_30days 
-                        (ingest_ts_sgt, carpark_number, total_lots, lot_type, 
-                         available_lots, update_datetime_sg, payload_json)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (update_datetime_sg, carpark_number) DO UPDATE SET
-                        ingest_ts_sgt = EXCLUDED.ingest_ts_sgt,
-                        total_lots = EXCLUDED.total_lots,
-                        available_lots = EXCLUDED.available_lots,
-                        lot_type = EXCLUDED.lot_type,
-                        payload_json = EXCLUDED.payload_json
-                    """, (
-                        record['ingest_ts_utc'],
-                        record['carpark_number'],
-                        record['total_lots'],
-                        record['lot_type'],
-                        record['available_lots'],
-                        record['update_datetime_sg'],
-                        json.dumps(record['payload_json'])
-                    ))
-                    
-                    # Check if it was an update or insert
-                    if cur.rowcount > 0:
-                        # Check if it was an actual update by looking at the query result
-                        loaded_count += 1
-                
-            except Exception as e:
-                print(f"Error loading 6pm record {record.get('carpark_number')} at {record.get('update_datetime_sg')}: {e}")
-                error_count += 1
-                continue
+        # Upserts that matched an identical row are skipped and not counted
+        changed_count = cur.rowcount
         
         print(f"📊 Load summary:")
-        print(f"  - Records processed: {loaded_count}")
-        if error_count > 0:
-            print(f"  - Errors encountered: {error_count}")
+        print(f"  - Records processed: {len(rows)}")
+        print(f"  - Records inserted or updated: {changed_count}")
         
-        # Final check - count records in table
-        cur.execute("SELECT COUNT(*) FROM raw_carpark_availability_6pm_last_30days")
-        final_count = cur.fetchone()[0]
-        print(f"🔍 DEBUG: Final table count: {final_count} records")
-
-def load_carpark_availability_6pm_full_refresh(records):
-    """Load historical 6pm data with full table refresh (legacy compatibility)"""
-    return load_carpark_availability_6pm_last_30days(records, clear_existing=True)
+        return changed_count
 
 def cleanup_old_historical_data(days_to_keep=30):
     """Remove historical data older than specified days"""
@@ -191,10 +194,14 @@ def cleanup_old_historical_data(days_to_keep=30):
         with get_conn() as conn:
             cur = conn.cursor()
             
+            # Bind the cutoff as a plain value so the range predicate can use the
+            # primary key index on update_datetime_sg
+            cutoff_date = datetime.now(SG_TZ).date() - timedelta(days=days_to_keep)
+            
             cur.execute("""
                 DELETE FROM raw_carpark_availability_6pm_last_30days 
-                WHERE update_datetime_sg < CURRENT_DATE - INTERVAL '%s days'
-            """, (days_to_keep,))
+                WHERE update_datetime_sg < %s
+            """, (cutoff_date,))
             
             deleted_count = cur.rowcount
             if deleted_count > 0:
@@ -206,4 +213,19 @@ def cleanup_old_historical_data(days_to_keep=30):
             
     except Exception as e:
         print(f"Error cleaning up old historical data: {e}")
-        return 0
\ No newline at end of file
+        return 0
+
+def refresh_latest_availability():
+    """Recompute the latest-reading-per-lot-type view the current occupancy queries read from"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        # CONCURRENTLY keeps the view readable while it is rebuilt
+        cur.execute("REFRESH MATERIALIZED VIEW CONCURRENTLY mv_carpark_latest_availability")
+        print("🔄 Refreshed latest availability view")
+
+def refresh_6pm_utilization():
+    """Recompute the per-carpark 6pm utilization view the 6pm reports read from"""
+    with get_conn() as conn:
+        cur = conn.cursor()
+        cur.execute("REFRESH MATERIALIZED VIEW mv_carpark_6pm_utilization")
+        print("🔄 Refreshed 6pm utilization view")
@@ -1,67 +1,94 @@
 from datetime import datetime, timezone, timedelta
 import pandas as pd
-import json
+import orjson
+
+SG_TZ = timezone(timedelta(hours=8))
+
+# Columns of the availability frames handed to the loaders
+LOAD_COLUMNS = [
+    'ingest_ts_utc', 'carpark_number', 'total_lots', 'lot_type',
+    'available_lots', 'update_datetime_sg', 'payload_json'
+]
+
+def _flatten_carpark_info(items):
+    """Flatten items -> carpark_data -> carpark_info into one DataFrame row per lot type"""
+    rows = []
+    for item in items:
+        timestamp = item.get('timestamp')
+        for carpark in item.get('carpark_data', []):
+            # Serialize the raw carpark once and share it across its lot-type rows
+            payload = orjson.dumps(carpark).decode()
+            carpark_number = carpark.get('carpark_number')
+            rows.extend(
+                (
+                    timestamp,
+                    carpark_number,
+                    info.get('total_lots'),
+                    info.get('lot_type'),
+                    info.get('lots_available'),
+                    payload
+                )
+                for info in carpark.get('carpark_info', [])
+            )
+    return pd.DataFrame(rows, columns=[
+        'update_datetime_sg', 'carpark_number', 'total_lots',
+        'lot_type', 'lots_available', 'payload_json'
+    ])
+
+def _parse_sgt_timestamps(timestamps):
+    """Parse ISO timestamps into Singapore time in one vectorized pass.
+    
+    Timestamps without timezone info are assumed to be Singapore time;
+    missing or invalid timestamps become NaT.
+    """
+    timestamps = timestamps.astype('string')
+    has_tz = timestamps.str.contains(r'(?:Z|[+-]\d{2}:?\d{2})$', regex=True).fillna(False)
+    timestamps = timestamps.where(has_tz, timestamps + '+08:00')
+    parsed = pd.to_datetime(timestamps, utc=True, format='ISO8601', errors='coerce')
+    return parsed.dt.tz_convert('Asia/Singapore')
+
+def _item_timestamps(items):
+    """Parse every item's timestamp in one pass (one per API snapshot, not per carpark row)"""
+    return _parse_sgt_timestamps(pd.Series([item.get('timestamp') for item in items], dtype=object))
+
+def _carpark_count(items, mask):
+    """Number of carparks in the items selected by a boolean mask"""
+    return sum(len(item.get('carpark_data', [])) for item, selected in zip(items, mask) if selected)
+
+def _lots_to_int(values):
+    """Coerce lot counts to nullable integers (missing or blank -> None)"""
+    return pd.to_numeric(values, errors='coerce').astype('Int64')
+
+def _to_load_frame(df, ingest_ts):
+    """Shape flattened rows into the column layout the loaders expect"""
+    return pd.DataFrame({
+        'ingest_ts_utc': ingest_ts.replace(tzinfo=None),
+        'carpark_number': df['carpark_number'],
+        'total_lots': _lots_to_int(df['total_lots']),
+        'lot_type': df['lot_type'],
+        'available_lots': _lots_to_int(df['lots_available']),
+        'update_datetime_sg': df['update_datetime_sg'],
+        'payload_json': df['payload_json']
+    }, index=df.index, columns=LOAD_COLUMNS)
 
 def transform_carpark_current_availability(raw_data, max_age_hours=10):
-    """Transform raw carpark availability data, filtering out stale records"""
+    """Transform raw carpark availability data into a DataFrame, filtering out stale records"""
     items = raw_data.get('items', [])
     if not items:
         print("No availability data to transform")
-        return []
+        return pd.DataFrame(columns=LOAD_COLUMNS)
     
-    records = []
     # Use Singapore timezone for all datetime operations
-    singapore_tz = timezone(timedelta(hours=8))
-    ingest_ts = datetime.now(singapore_tz)
+    ingest_ts = datetime.now(SG_TZ)
     cutoff_time = ingest_ts - timedelta(hours=max_age_hours)
     
-    stale_count = 0
+    # Filter whole snapshots by timestamp before flattening their carparks;
+    # items without a valid timestamp count as stale
+    fresh = (_item_timestamps(items) >= cutoff_time).to_numpy()
+    stale_count = _carpark_count(items, ~fresh)
     
-    for item in items:
-        carpark_data = item.get('carpark_data', [])
-        update_datetime_str = item.get('timestamp')
-        
-        # Parse and validate timestamp
-        try:
-            if update_datetime_str:
-                # Parse timestamp and convert to Singapore time for comparison
-                update_datetime = datetime.fromisoformat(update_datetime_str.replace('Z', '+00:00'))
-                if update_datetime.tzinfo is None:
-                    # Assume Singapore time if no timezone info
-                    update_datetime = update_datetime.replace(tzinfo=singapore_tz)
-                else:
-                    # Convert to Singapore time for consistent comparison
-                    update_datetime = update_datetime.astimezone(singapore_tz)
-                
-                # Skip if data is too old
-                if update_datetime < cutoff_time:
-                    stale_count += len(carpark_data)
-                    continue
-            else:
-                # Skip records without timestamp
-                stale_count += len(carpark_data)
-                continue
-                
-        except (ValueError, TypeError) as e:
-            print(f"Invalid timestamp format: {update_datetime_str}, skipping")
-            stale_count += len(carpark_data)
-            continue
-        
-        for carpark in carpark_data:
-            carpark_number = carpark.get('carpark_number')
-            carpark_info = carpark.get('carpark_info', [])
-            
-            for info in carpark_info:
-                record = {
-                    'ingest_ts_utc': ingest_ts.replace(tzinfo=None),
-                    'carpark_number': carpark_number,
-                    'total_lots': int(info.get('total_lots', 0)) if info.get('total_lots') else None,
-                    'lot_type': info.get('lot_type'),
-                    'available_lots': int(info.get('lots_available', 0)) if info.get('lots_available') else None,
-                    'update_datetime_sg': update_datetime_str,
-                    'payload_json': carpark
-                }
-                records.append(record)
+    df = _flatten_carpark_info([item for item, keep in zip(items, fresh) if keep])
+    records = _to_load_frame(df, ingest_ts)
     
     print(f"Transformed {len(records)} current availability records")
     if stale_count > 0:
@@ -76,76 +103,36 @@ def transform_carpark_info(raw_data):
     return records
 
 def transform_carpark_availability_6pm_historical(raw_data):
-    """Transform historical carpark availability data for 6pm analysis, filtering out records older than 30 days and not within 1 hour of 6pm"""
+    """Transform historical carpark availability data for 6pm analysis into a DataFrame, filtering out records older than 30 days and not within 1 hour of 6pm"""
     items = raw_data.get('items', [])
     if not items:
         print("No historical 6pm availability data to transform")
-        return []
+        return pd.DataFrame(columns=LOAD_COLUMNS)
     
-    records = []
     # Use Singapore timezone for all datetime operations
-    singapore_tz = timezone(timedelta(hours=8))
-    ingest_ts = datetime.now(singapore_tz)
+    ingest_ts = datetime.now(SG_TZ)
     cutoff_time = ingest_ts - timedelta(days=30)
     
-    old_count = 0
-    non_6pm_count = 0
+    # Filter whole snapshots by timestamp before flattening their carparks
+    update_datetime = _item_timestamps(items)
+    invalid = update_datetime.isna().to_numpy()
+    old = ~invalid & (update_datetime < cutoff_time).to_numpy()
+    # Skip if timestamp is not within 1 hour of 6pm (between 5pm-7pm)
+    hour = update_datetime.dt.hour
+    non_6pm = ~invalid & ~old & ((hour < 17) | (hour >= 19)).to_numpy()
+    keep = ~(invalid | old | non_6pm)
     
-    for item in items:
-        carpark_data = item.get('carpark_data', [])
-        update_datetime_str = item.get('timestamp')
-        
-        # Parse and validate timestamp
-        try:
-            if update_datetime_str:
-                # Parse timestamp and convert to Singapore time for comparison
-                update_datetime = datetime.fromisoformat(update_datetime_str.replace('Z', '+00:00'))
-                if update_datetime.tzinfo is None:
-                    # Assume Singapore time if no timezone info
-                    update_datetime = update_datetime.replace(tzinfo=singapore_tz)
-                else:
-                    # Convert to Singapore time for consistent comparison
-                    update_datetime = update_datetime.astimezone(singapore_tz)
-                
-                # Skip if data is older than 30 days
-                if update_datetime < cutoff_time:
-                    old_count += len(carpark_data)
-                    continue
-                
-                # Skip if timestamp is not within 1 hour of 6pm (between 5pm-7pm)
-                hour = update_datetime.hour
-                if hour < 17 or hour >= 19:  # Not between 5pm (17:00) and 7pm (19:00)
-                    non_6pm_count += len(carpark_data)
-                    continue
-            else:
-                # Skip records without timestamp
-                print(f"Skipping record without timestamp")
-                continue
-                
-        except (ValueError, TypeError) as e:
-            print(f"Invalid timestamp format: {update_datetime_str}, skipping")
-            continue
-        
-        for carpark in carpark_data:
-            carpark_number = carpark.get('carpark_number')
-            carpark_info = carpark.get('carpark_info', [])
-            
-            for info in carpark_info:
-                record = {
-                    'ingest_ts_utc': ingest_ts.replace(tzinfo=None),
-                    'carpark_number': carpark_number,
-                    'total_lots': int(info.get('total_lots', 0)) if info.get('total_lots') else None,
-                    'lot_type': info.get('lot_type'),
-                    'available_lots': int(info.get('lots_available', 0)) if info.get('lots_available') else None,
-                    'update_datetime_sg': update_datetime_str,
-                    'payload_json': carpark
-                }
-                records.append(record)
+    df = _flatten_carpark_info([item for item, selected in zip(items, keep) if selected])
+    records = _to_load_frame(df, ingest_ts)
     
     print(f"Transformed {len(records)} historical 6pm availability records")
+    if invalid.any():
+        print(f"Skipped {int(invalid.sum())} snapshots with missing or invalid timestamps")
+    old_count = _carpark_count(items, old)
     if old_count > 0:
         print(f"Filtered out {old_count} records older than 30 days")
+    non_6pm_count = _carpark_count(items, non_6pm)
     if non_6pm_count > 0:
         print(f"Filtered out {non_6pm_count} records not within 6pm ±1 hour (5pm-7pm)")
     
-    return records
\ No newline at end of file
+    return records
@@ -8,49 +8,52 @@ It focuses on real-time data collection and analysis with interactive map visual
 """
 
 from prefect import flow, task
+from prefect.futures import as_completed
 from prefect.utilities.annotations import quote
-from etl.extract import fetch_carpark_availability, fetch_carpark_info
+from etl.extract import fetch_carpark_availability_if_stale, fetch_carpark_info_if_changed
 from etl.transform import transform_carpark_current_availability, transform_carpark_info
-from etl.load import load_carpark_current_availability, load_carpark_info
+from etl.load import load_carpark_current_availability, load_carpark_info, refresh_latest_availability
 from etl.reports import get_current_occupancy
-from etl.db import get_conn
-from datetime import datetime
+from etl.db import read_sql
+from datetime import datetime, timedelta
 from pathlib import Path
-import pandas as pd
+import gzip
+import hashlib
 import json
+import numpy as np
+import pandas as pd
 import os
-import warnings
-warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
 
-@task
+@task(persist_result=False)
 def extract_current_availability():
-    """Extract real-time carpark availability data"""
-    return fetch_carpark_availability()
+    """Extract real-time carpark availability data, or None if the loaded snapshot is still current"""
+    return fetch_carpark_availability_if_stale()
 
-@task
+@task(persist_result=False)
 def extract_carpark_reference_info():
-    """Extract carpark reference information"""
-    return fetch_carpark_info()
-
-@task
-def transform_current_availability(raw_data):
-    """Transform current availability data"""
-    return transform_carpark_current_availability(raw_data)
+    """Extract carpark reference information, or (None, None) if it is unchanged"""
+    return fetch_carpark_info_if_changed()
 
 @task
-def transform_reference_info(raw_data):
-    """Transform carpark reference data"""
-    return transform_carpark_info(raw_data)
+def transform_and_load_current_availability(raw_data):
+    """Transform current availability data and load it to database"""
+    if raw_data is None:
+        print("Availability snapshot still current - skipping transform and load")
+        return
+    return load_carpark_current_availability(transform_carpark_current_availability(raw_data))
 
 @task
-def load_current_availability(records):
-    """Load current availability data to database"""
-    return load_carpark_current_availability(records)
+def transform_and_load_reference_info(raw_data, sync_state=None):
+    """Transform carpark reference data and load it to database"""
+    if raw_data is None:
+        print("Carpark reference data unchanged - skipping transform and load")
+        return 0
+    return load_carpark_info(transform_carpark_info(raw_data), sync_state=sync_state)
 
 @task
-def load_reference_info(records):
-    """Load carpark reference data to database"""
-    return load_carpark_info(records)
+def refresh_latest_availability_view():
+    """Rebuild the latest-reading-per-lot-type view shared by the occupancy and map queries"""
+    return refresh_latest_availability()
 
 @task
 def analyze_current_occupancy():
@@ -58,10 +61,11 @@ def analyze_current_occupancy():
     result = get_current_occupancy()
     
     if not result.empty:
-        occupied_lots = result.iloc[0]['occupied_lots']
-        total_lots = result.iloc[0]['total_lots']
-        available_lots = result.iloc[0]['available_lots']
-        occupancy_rate = result.iloc[0]['occupancy_rate']
+        row = result.iloc[0]
+        occupied_lots = int(row['occupied_lots'])
+        total_lots = int(row['total_lots'])
+        available_lots = int(row['available_lots'])
+        occupancy_rate = row['occupancy_rate']
         
         print(f"\n🏗️  CURRENT OCCUPANCY ANALYSIS")
         print(f"=" * 50)
@@ -73,44 +77,55 @@ def analyze_current_occupancy():
     
     return result
 
-@task
+@task(persist_result=False)
 def get_map_data():
     """Get carpark location and availability data for map visualization"""
-    with get_conn() as conn:
-        query = """
+    query = """
         SELECT 
             latest.carpark_number,
             info.address,
-            info.x_coord,
-            info.y_coord,
+            -- Raw SVY21 coordinates scaled down for the report's relative positioning
+            -- (no geographic conversion needed)
+            (info.y_coord::float8 - 30000) / 10000 as lat,
+            (info.x_coord::float8 - 20000) / 10000 as lng,
             SUM(latest.total_lots) as total_lots,
             SUM(latest.available_lots) as available_lots,
             SUM(latest.total_lots - latest.available_lots) as occupied_lots,
             ROUND(SUM(latest.total_lots - latest.available_lots)::numeric / NULLIF(SUM(latest.total_lots), 0) * 100, 1) as occupancy_rate
-        FROM (
-            SELECT DISTINCT ON (carpark_number, lot_type)
-                carpark_number, lot_type, total_lots, available_lots
-            FROM raw_carpark_current_availability
-            WHERE total_lots IS NOT NULL 
-              AND available_lots IS NOT NULL
-              AND total_lots > 0
-            ORDER BY carpark_number, lot_type, ingest_ts_sgt DESC
-        ) latest
+        FROM mv_carpark_latest_availability latest
         INNER JOIN ref_carpark_info info ON latest.carpark_number = info.car_park_no
-        WHERE info.x_coord IS NOT NULL 
-          AND info.y_coord IS NOT NULL
-          AND info.x_coord != ''
-          AND info.y_coord != ''
+        WHERE info.x_coord ~ '^-?[0-9]+([.][0-9]+)?$'
+          AND info.y_coord ~ '^-?[0-9]+([.][0-9]+)?$'
         GROUP BY latest.carpark_number, info.address, info.x_coord, info.y_coord
         HAVING SUM(latest.total_lots) > 0
-        ORDER BY SUM(latest.available_lots) DESC
-        """
-        
-        df = pd.read_sql(query, conn)
-        print(f"📍 Retrieved {len(df)} carparks with location data for mapping")
-        return df
+        ORDER BY SUM(latest.available_lots) DESC, latest.carpark_number
+    """
+    
+    df = read_sql(query)
+    # Lot counts fit comfortably in 32 bits; positions and rates stay float64 so
+    # the serialized map data carries no float32 rounding noise
+    df = df.astype({
+        'total_lots': 'int32',
+        'available_lots': 'int32',
+        'occupied_lots': 'int32'
+    })
+    print(f"📍 Retrieved {len(df)} carparks with location data for mapping")
+    return df
 
-@task
+def _report_cache_key(context, parameters):
+    """Cache key for the HTML report: a hash of its input frames and the output directory"""
+    # No key (so no cache hit) if the report that a cached result points at is gone
+    if not Path("reports", "current_occupancy_report.html").exists():
+        return None
+    
+    digest = hashlib.sha1(os.getcwd().encode())
+    for frame in (parameters['analysis_result'], parameters['map_data']):
+        digest.update(pd.util.hash_pandas_object(frame).values.tobytes())
+    return digest.hexdigest()
+
+# Reruns within a few minutes on unchanged readings reuse the last report
+# instead of rendering and writing it again
+@task(cache_key_fn=_report_cache_key, cache_expiration=timedelta(minutes=5))
 def generate_html_report(analysis_result, map_data):
     """Generate HTML report for current occupancy analysis with interactive map"""
     
@@ -122,96 +137,63 @@ def generate_html_report(analysis_result, map_data):
         html_content = generate_empty_report_html()
     else:
         # Extract data from analysis result
-        occupied_lots = int(analysis_result.iloc[0]['occupied_lots'])
-        total_lots = int(analysis_result.iloc[0]['total_lots'])
-        available_lots = int(analysis_result.iloc[0]['available_lots'])
-        occupancy_rate = float(analysis_result.iloc[0]['occupancy_rate'])
+        row = analysis_result.iloc[0]
+        occupied_lots = int(row['occupied_lots'])
+        total_lots = int(row['total_lots'])
+        available_lots = int(row['available_lots'])
+        occupancy_rate = float(row['occupancy_rate'])
         
         html_content = generate_occupancy_report_html(
             occupied_lots, total_lots, available_lots, occupancy_rate, map_data
         )
     
-    # Write HTML report
+    # Write HTML report (encoded once, written in one call), plus a gzipped
+    # copy for shipping as an artifact or attachment
     report_path = reports_dir / "current_occupancy_report.html"
-    with open(report_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    html_bytes = html_content.encode('utf-8')
+    report_path.write_bytes(html_bytes)
+    (reports_dir / "current_occupancy_report.html.gz").write_bytes(gzip.compress(html_bytes, compresslevel=6))
     
     print(f"📄 HTML report with interactive map generated: {report_path}")
     return str(report_path)
 
-def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, occupancy_rate, map_data):
-    """Generate HTML content for occupancy report with interactive map"""
-    
-    # Determine status color based on occupancy rate
-    if occupancy_rate >= 90:
-        status_color = "#dc3545"  # Red - Very High
-        status_text = "Very High"
-        status_icon = "🔴"
-    elif occupancy_rate >= 80:
-        status_color = "#fd7e14"  # Orange - High
-        status_text = "High"
-        status_icon = "🟠"
-    elif occupancy_rate >= 60:
-        status_color = "#ffc107"  # Yellow - Moderate
-        status_text = "Moderate"
-        status_icon = "🟡"
-    else:
-        status_color = "#198754"  # Green - Low
-        status_text = "Low"
-        status_icon = "🟢"
-    
-    # Calculate utilization percentage for visual bar
-    utilization_width = min(occupancy_rate, 100)
-    
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S SGT")
-    
-    # Prepare map data as JSON
-    map_markers = []
-    if not map_data.empty:
-        for _, row in map_data.iterrows():
-            try:
-                # Convert Singapore SVY21 coordinates to relative positioning
-                x_coord = float(row['x_coord'])
-                y_coord = float(row['y_coord'])
-                
-                # Use raw coordinates for relative positioning (no geographic conversion needed)
-                # Scale down significantly for better visualization in simple coordinate system
-                lat = (y_coord - 30000) / 10000  # Scale Y coordinate to range roughly -2 to +2
-                lng = (x_coord - 20000) / 10000  # Scale X coordinate to range roughly -1 to +3
-                
-                # Calculate marker size based on total lots (min 6, max 40 pixels)
-                total = int(row['total_lots'])
-                marker_size = max(6, min(40, 6 + total / 100))  # Scale based on total capacity
-                
-                # Color based on occupancy rate
-                occ_rate = float(row['occupancy_rate']) if row['occupancy_rate'] else 0
-                if occ_rate >= 90:
-                    color = '#dc3545'  # Red
-                elif occ_rate >= 80:
-                    color = '#fd7e14'  # Orange
-                elif occ_rate >= 60:
-                    color = '#ffc107'  # Yellow
-                else:
-                    color = '#28a745'  # Green
-                
-                map_markers.append({
-                    'lat': lat,
-                    'lng': lng,
-                    'carpark_number': row['carpark_number'],
-                    'address': row['address'],
-                    'total_lots': total,
-                    'available_lots': int(row['available_lots']),
-                    'occupied_lots': int(row['occupied_lots']),
-                    'occupancy_rate': occ_rate,
-                    'marker_size': marker_size,
-                    'color': color
-                })
-            except (ValueError, TypeError):
-                continue  # Skip invalid coordinates
-    
-    map_data_json = json.dumps(map_markers)
+# Map data for a report with no carparks to plot (same columns as _map_markers)
+_EMPTY_MAP_DATA_JSON = json.dumps(dict.fromkeys([
+    'lat', 'lng', 'carpark_number', 'address', 'carpark_number_lc', 'address_lc',
+    'total_lots', 'available_lots', 'occupied_lots', 'occupancy_rate',
+    'marker_size', 'color'
+], []))
+
+def _map_markers(map_data):
+    """Build one map marker row per carpark with column-wise operations"""
+    total_lots = map_data['total_lots']
+    occ_rate = map_data['occupancy_rate'].fillna(0)
     
-    html_content = f"""
+    return pd.DataFrame({
+        'lat': map_data['lat'],
+        'lng': map_data['lng'],
+        'carpark_number': map_data['carpark_number'],
+        'address': map_data['address'],
+        # Lowercased once here so the page's search doesn't redo it per keystroke
+        'carpark_number_lc': map_data['carpark_number'].str.lower(),
+        'address_lc': map_data['address'].fillna('').str.lower(),
+        'total_lots': total_lots,
+        'available_lots': map_data['available_lots'],
+        'occupied_lots': map_data['occupied_lots'],
+        'occupancy_rate': occ_rate,
+        # Marker size based on total capacity (min 6, max 40 pixels)
+        'marker_size': (6 + total_lots / 100).clip(6, 40),
+        # Color based on occupancy rate: red, orange, yellow, else green
+        'color': np.select(
+            [occ_rate >= 90, occ_rate >= 80, occ_rate >= 60],
+            ['#dc3545', '#fd7e14', '#ffc107'],
+            default='#28a745'
+        )
+    })
+
+# Static page scaffold for the occupancy report, built once at import; only the
+# dynamic slots are filled in per report with str.format
+_OCCUPANCY_REPORT_TEMPLATE = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -509,7 +491,7 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
                         </div>
                         <div class="info-item">
                             <span class="info-label">Map Points:</span>
-                            <span class="info-value">{len(map_markers)} carparks</span>
+                            <span class="info-value">{map_points} carparks</span>
                         </div>
                     </div>
                     
@@ -548,11 +530,11 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
             var markers = [];
             var markerLookup = {{}};  // For search functionality
             
-            mapData.forEach(function(carpark) {{
+            for (var i = 0; i < mapData.carpark_number.length; i++) {{
                 
-                var marker = L.circleMarker([carpark.lat, carpark.lng], {{
-                    radius: carpark.marker_size,
-                    fillColor: carpark.color,
+                var marker = L.circleMarker([mapData.lat[i], mapData.lng[i]], {{
+                    radius: mapData.marker_size[i],
+                    fillColor: mapData.color[i],
                     color: '#333',
                     weight: 2,
                     opacity: 1,
@@ -561,23 +543,23 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
                 
                 var popupContent = `
                     <div style="min-width: 200px;">
-                        <h4 style="margin: 0 0 10px 0; color: #2c3e50;">🅿️ ${{carpark.carpark_number}}</h4>
-                        <p style="margin: 0 0 8px 0; font-size: 0.9em; color: #6c757d;">📍 ${{carpark.address}}</p>
+                        <h4 style="margin: 0 0 10px 0; color: #2c3e50;">🅿️ ${{mapData.carpark_number[i]}}</h4>
+                        <p style="margin: 0 0 8px 0; font-size: 0.9em; color: #6c757d;">📍 ${{mapData.address[i]}}</p>
                         <div style="display: grid; grid-template-columns: 1fr 1fr; gap: 10px; margin: 10px 0;">
                             <div style="text-align: center; padding: 8px; background: #f8f9fa; border-radius: 4px;">
-                                <div style="font-size: 1.2em; font-weight: bold; color: #28a745;">${{carpark.available_lots}}</div>
+                                <div style="font-size: 1.2em; font-weight: bold; color: #28a745;">${{mapData.available_lots[i]}}</div>
                                 <div style="font-size: 0.8em; color: #6c757d;">Available</div>
                             </div>
                             <div style="text-align: center; padding: 8px; background: #f8f9fa; border-radius: 4px;">
-                                <div style="font-size: 1.2em; font-weight: bold; color: #dc3545;">${{carpark.occupied_lots}}</div>
+                                <div style="font-size: 1.2em; font-weight: bold; color: #dc3545;">${{mapData.occupied_lots[i]}}</div>
                                 <div style="font-size: 0.8em; color: #6c757d;">Occupied</div>
                             </div>
                         </div>
-                        <div style="text-align: center; padding: 8px; background: ${{carpark.color}}; color: white; border-radius: 4px; margin-top: 8px;">
-                            <strong>${{carpark.occupancy_rate}}% Occupied</strong>
+                        <div style="text-align: center; padding: 8px; background: ${{mapData.color[i]}}; color: white; border-radius: 4px; margin-top: 8px;">
+                            <strong>${{mapData.occupancy_rate[i]}}% Occupied</strong>
                         </div>
                         <div style="text-align: center; margin-top: 8px; font-size: 0.8em; color: #6c757d;">
-                            Total: ${{carpark.total_lots}} lots
+                            Total: ${{mapData.total_lots[i]}} lots
                         </div>
                     </div>
                 `;
@@ -587,9 +569,9 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
                 markers.push(marker);
                 
                 // Store marker for search functionality
-                markerLookup[carpark.carpark_number.toLowerCase()] = marker;
-                markerLookup[carpark.address.toLowerCase()] = marker;
-            }});
+                markerLookup[mapData.carpark_number_lc[i]] = marker;
+                markerLookup[mapData.address_lc[i]] = marker;
+            }}
             
             // Set initial view and fit bounds
             if (markers.length > 0) {{
@@ -622,14 +604,14 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
                     }});
                 }}
                 
-                // Search through carpark data
+                // Search through carpark data (matches are indices into mapData and markers)
                 var matches = [];
-                mapData.forEach(function(carpark) {{
-                    if (carpark.address.toLowerCase().includes(searchTerm) || 
-                        carpark.carpark_number.toLowerCase().includes(searchTerm)) {{
-                        matches.push(carpark);
+                for (var i = 0; i < mapData.carpark_number.length; i++) {{
+                    if (mapData.address_lc[i].includes(searchTerm) || 
+                        mapData.carpark_number_lc[i].includes(searchTerm)) {{
+                        matches.push(i);
                     }}
-                }});
+                }}
                 
                 if (matches.length === 0) {{
                     resultsDiv.innerHTML = '<span style="color: #dc3545;">❌ No carparks found matching "' + searchTerm + '"</span>';
@@ -638,16 +620,8 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
                 
                 if (matches.length === 1) {{
                     // Single match - zoom to it
-                    var carpark = matches[0];
-                    var marker = null;
-                    
-                    // Find the corresponding marker
-                    markers.forEach(function(m) {{
-                        var popup = m.getPopup();
-                        if (popup && popup.getContent().includes(carpark.carpark_number)) {{
-                            marker = m;
-                        }}
-                    }});
+                    var match = matches[0];
+                    var marker = markers[match];
                     
                     if (marker) {{
                         // Highlight the marker
@@ -661,13 +635,13 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
                         map.setView(marker.getLatLng(), 5);
                         marker.openPopup();
                         
-                        resultsDiv.innerHTML = '<span style="color: #28a745;">✅ Found: ' + carpark.address + '</span>';
+                        resultsDiv.innerHTML = '<span style="color: #28a745;">✅ Found: ' + mapData.address[match] + '</span>';
                     }}
                 }} else {{
                     // Multiple matches - show list
                     resultsDiv.innerHTML = '<span style="color: #007bff;">📍 Found ' + matches.length + ' carparks:</span><br>' +
-                        matches.slice(0, 5).map(function(cp) {{
-                            return '<small style="margin-left: 10px;">• ' + cp.carpark_number + ': ' + cp.address + '</small>';
+                        matches.slice(0, 5).map(function(idx) {{
+                            return '<small style="margin-left: 10px;">• ' + mapData.carpark_number[idx] + ': ' + mapData.address[idx] + '</small>';
                         }}).join('<br>') +
                         (matches.length > 5 ? '<br><small style="margin-left: 10px; color: #6c757d;">... and ' + (matches.length - 5) + ' more. Try a more specific search.</small>' : '');
                 }}
@@ -703,14 +677,59 @@ def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, oc
     </body>
     </html>
     """
-    
-    return html_content
 
-def generate_empty_report_html():
-    """Generate HTML content when no data is available"""
+def generate_occupancy_report_html(occupied_lots, total_lots, available_lots, occupancy_rate, map_data):
+    """Generate HTML content for occupancy report with interactive map"""
+    
+    # Determine status color based on occupancy rate
+    if occupancy_rate >= 90:
+        status_color = "#dc3545"  # Red - Very High
+        status_text = "Very High"
+        status_icon = "🔴"
+    elif occupancy_rate >= 80:
+        status_color = "#fd7e14"  # Orange - High
+        status_text = "High"
+        status_icon = "🟠"
+    elif occupancy_rate >= 60:
+        status_color = "#ffc107"  # Yellow - Moderate
+        status_text = "Moderate"
+        status_icon = "🟡"
+    else:
+        status_color = "#198754"  # Green - Low
+        status_text = "Low"
+        status_icon = "🟢"
+    
+    # Calculate utilization percentage for visual bar
+    utilization_width = min(occupancy_rate, 100)
+    
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S SGT")
     
-    return f"""
+    # Prepare map data as JSON, one array per marker column so field names
+    # aren't repeated for every carpark
+    if map_data.empty:
+        map_points, map_data_json = 0, _EMPTY_MAP_DATA_JSON
+    else:
+        map_markers = _map_markers(map_data)
+        map_points, map_data_json = len(map_markers), json.dumps(map_markers.to_dict('list'))
+    
+    html_content = _OCCUPANCY_REPORT_TEMPLATE.format(
+        status_color=status_color,
+        status_text=status_text,
+        status_icon=status_icon,
+        occupied_lots=occupied_lots,
+        total_lots=total_lots,
+        available_lots=available_lots,
+        occupancy_rate=occupancy_rate,
+        utilization_width=utilization_width,
+        current_time=current_time,
+        map_points=map_points,
+        map_data_json=map_data_json
+    )
+    
+    return html_content
+
+# Page for a run with no usable availability data; filled in with str.format
+_EMPTY_REPORT_TEMPLATE = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -768,8 +787,14 @@ def generate_empty_report_html():
     </html>
     """
 
+def generate_empty_report_html():
+    """Generate HTML content when no data is available"""
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S SGT")
+    
+    return _EMPTY_REPORT_TEMPLATE.format(current_time=current_time)
+
 @flow(name="Current Occupancy Analysis")
-def current_occupancy_pipeline():
+def current_occupancy_pipeline(reference_loaded=False):
     """
     Pipeline to answer: How many HDB carpark lots are currently occupied?
     
@@ -779,29 +804,46 @@ def current_occupancy_pipeline():
     3. Transforms and loads the data
     4. Analyzes current occupancy focusing on electronic parking systems
     5. Generates an HTML report with interactive map visualization
+    
+    Args:
+        reference_loaded: True if the caller already loaded ref_carpark_info this
+                          run; otherwise this pipeline extracts and loads it itself
     """
     print("🚀 Starting Current Occupancy Pipeline...")
     
-    # Extract data
-    availability_data = extract_current_availability()
-    reference_data = extract_carpark_reference_info()
+    # The availability and reference branches are independent, so both run
+    # concurrently and each transform+load is submitted as soon as its own
+    # extract is in (results are unwrapped first so they can be passed quoted)
     
-    # Transform data
-    availability_records = transform_current_availability(quote(availability_data))
-    reference_records = transform_reference_info(quote(reference_data))
+    # Extract data (reference info only if the caller hasn't loaded it already)
+    load_reference = not reference_loaded
+    availability_future = extract_current_availability.submit()
+    extract_futures = [availability_future]
+    if load_reference:
+        extract_futures.append(extract_carpark_reference_info.submit())
     
-    # Load data
-    load_current_availability(quote(availability_records))
-    load_reference_info(quote(reference_records))
+    # Transform and load data
+    load_futures = []
+    for extract_future in as_completed(extract_futures):
+        if extract_future is availability_future:
+            load_futures.append(transform_and_load_current_availability.submit(quote(extract_future.result())))
+        else:
+            reference_data, reference_sync_state = extract_future.result()
+            load_futures.append(transform_and_load_reference_info.submit(quote(reference_data), reference_sync_state))
+    for load_future in load_futures:
+        load_future.result()
     
-    # Analyze and report
-    results = analyze_current_occupancy()
+    # Pick the latest reading per lot type once for both reads below
+    refresh_latest_availability_view()
     
-    # Get map data
-    map_data = get_map_data()
+    # Analyze and get map data (independent reads of the loaded tables)
+    results_future = analyze_current_occupancy.submit()
+    map_data_future = get_map_data.submit()
+    results = results_future.result()
+    map_data = map_data_future.result()
     
     # Generate HTML report with map
-    report_path = generate_html_report(results, map_data)
+    report_path = generate_html_report(quote(results), quote(map_data))
     
     print("✅ Current Occupancy Pipeline completed!")
     print(f"📄 HTML report with interactive map available at: {report_path}")
@@ -10,16 +10,18 @@ optimized delta loading to only fetch missing data.
 """
 
 from prefect import flow, task
+from prefect.futures import as_completed
 from prefect.utilities.annotations import quote
-from etl.extract import fetch_carpark_availability_6pm_historical, fetch_carpark_availability_6pm_historical_full, fetch_carpark_info
+from etl.extract import fetch_carpark_availability_6pm_historical, fetch_carpark_availability_6pm_historical_full, fetch_carpark_info_if_changed
 from etl.transform import transform_carpark_availability_6pm_historical, transform_carpark_info
-from etl.load import load_carpark_availability_6pm_last_30days, load_carpark_info, cleanup_old_historical_data
+from etl.load import load_carpark_availability_6pm_last_30days, load_carpark_info, cleanup_old_historical_data, refresh_6pm_utilization
 from etl.reports import get_6pm_high_utilization_carparks, get_6pm_scatterplot_data, get_6pm_capacity_buckets
+from datetime import datetime
+import gzip
 import pandas as pd
-import warnings
-warnings.filterwarnings('ignore', message='pandas only supports SQLAlchemy')
+import os
 
-@task
+@task(persist_result=False)
 def extract_6pm_historical_data(force_full_refresh=False):
     """Extract historical 6pm carpark availability data (delta loading by default)"""
     if force_full_refresh:
@@ -27,118 +29,104 @@ def extract_6pm_historical_data(force_full_refresh=False):
     else:
         return fetch_carpark_availability_6pm_historical()
 
-@task
+@task(persist_result=False)
 def extract_carpark_reference_info():
-    """Extract carpark reference information"""
-    return fetch_carpark_info()
-
-@task
-def transform_6pm_historical_data(raw_data):
-    """Transform historical 6pm availability data"""
-    return transform_carpark_availability_6pm_historical(raw_data)
+    """Extract carpark reference information, or (None, None) if it is unchanged"""
+    return fetch_carpark_info_if_changed()
 
 @task
-def transform_reference_info(raw_data):
-    """Transform carpark reference data"""
-    return transform_carpark_info(raw_data)
+def transform_and_load_6pm_historical_data(raw_data):
+    """Transform historical 6pm availability data and upsert it to database"""
+    records = transform_carpark_availability_6pm_historical(raw_data)
+    print(f"Loading {len(records)} historical records")
+    return load_carpark_availability_6pm_last_30days(records)
 
 @task
-def load_6pm_historical_data(records, use_delta_loading=True):
-    """Load historical 6pm data to database with delta loading support"""
-    return load_carpark_availability_6pm_last_30days(records, clear_existing=not use_delta_loading)
-
-@task
-def load_reference_info(records):
-    """Load carpark reference data to database"""
-    return load_carpark_info(records)
+def transform_and_load_reference_info(raw_data, sync_state=None):
+    """Transform carpark reference data and load it to database"""
+    if raw_data is None:
+        print("Carpark reference data unchanged - skipping transform and load")
+        return 0
+    return load_carpark_info(transform_carpark_info(raw_data), sync_state=sync_state)
 
 @task
 def cleanup_old_data():
     """Clean up historical data older than 30 days"""
     return cleanup_old_historical_data(days_to_keep=30)
 
+@task
+def refresh_6pm_utilization_view():
+    """Rebuild the per-carpark 6pm utilization aggregate shared by the report queries"""
+    return refresh_6pm_utilization()
+
 @task
 def analyze_6pm_high_utilization():
     """Analyze 6pm high utilization carparks and return results"""
     summary_result, detail_result = get_6pm_high_utilization_carparks()
     
     if not summary_result.empty:
-        high_util_count = summary_result.iloc[0]['high_utilization_carparks']
-        very_high_util_count = summary_result.iloc[0]['very_high_utilization_carparks']
-        avg_utilization = summary_result.iloc[0]['overall_avg_utilization']
-        max_utilization = summary_result.iloc[0]['max_utilization']
+        row = summary_result.iloc[0]
+        high_util_count = int(row['high_utilization_carparks'])
+        very_high_util_count = int(row['very_high_utilization_carparks'])
+        avg_utilization = row['overall_avg_utilization']
+        max_utilization = row['max_utilization']
         
-        print(f"\n🌆 6PM HIGH UTILIZATION ANALYSIS")
-        print(f"=" * 60)
-        print(f"📊 Carparks with ≥80% utilization: {high_util_count}")
-        print(f"🔥 Carparks with ≥90% utilization: {very_high_util_count}")
-        print(f"📈 Average utilization (high-util): {avg_utilization:.1f}%")
-        print(f"🏆 Maximum utilization: {max_utilization:.1f}%")
-        print(f"=" * 60)
+        # Build the summary block first and print it in one write, so it stays
+        # together when other task output is interleaved
+        lines = [
+            f"\n🌆 6PM HIGH UTILIZATION ANALYSIS",
+            f"=" * 60,
+            f"📊 Carparks with ≥80% utilization: {high_util_count}",
+            f"🔥 Carparks with ≥90% utilization: {very_high_util_count}",
+            f"📈 Average utilization (high-util): {avg_utilization:.1f}%",
+            f"🏆 Maximum utilization: {max_utilization:.1f}%",
+            f"=" * 60,
+        ]
         
         if not detail_result.empty:
-            print(f"\n🏅 TOP HIGH-UTILIZATION CARPARKS:")
-            for idx, row in detail_result.head(5).iterrows():
-                print(f"  {row['carpark_number']} - {row['avg_utilization_percent']}% "
-                      f"({row['data_points']} data points)")
+            lines.append(f"\n🏅 TOP HIGH-UTILIZATION CARPARKS:")
+            for row in detail_result.head(5).itertuples(index=False):
+                lines.append(f"  {row.carpark_number} - {row.avg_utilization_percent}% "
+                             f"({row.data_points} data points)")
+        
+        print("\n".join(lines))
     
     return summary_result, detail_result
 
 @task
-def generate_6pm_html_report(summary_result, detail_result):
+def get_scatterplot_data():
+    """Get total lots vs utilization for every electronic parking carpark"""
+    return get_6pm_scatterplot_data()
+
+@task
+def get_capacity_buckets():
+    """Get the top carparks by utilization in each capacity bucket"""
+    return get_6pm_capacity_buckets()
+
+@task
+def generate_6pm_html_report(summary_result, detail_result, scatterplot_data, capacity_buckets_data):
     """Generate HTML report for 6pm historical analysis"""
     print("Generating 6pm historical analysis HTML report...")
     
-    # Get additional data for visualizations
-    scatterplot_data = get_6pm_scatterplot_data()
-    capacity_buckets_data = get_6pm_capacity_buckets()
-    
     # Create HTML report
     html_content = create_6pm_html_report(summary_result, detail_result, scatterplot_data, capacity_buckets_data)
     
-    # Save to file
+    # Save to file (the reports directory may not exist yet on a fresh checkout),
+    # encoded once, plus a gzipped copy for shipping as an artifact or attachment
+    os.makedirs("reports", exist_ok=True)
     report_path = "reports/historical_6pm_report.html"
-    with open(report_path, 'w', encoding='utf-8') as f:
-        f.write(html_content)
+    html_bytes = html_content.encode('utf-8')
+    with open(report_path, 'wb') as f:
+        f.write(html_bytes)
+    with open(report_path + '.gz', 'wb') as f:
+        f.write(gzip.compress(html_bytes, compresslevel=6))
     
     print(f"📊 6PM Historical Analysis Report saved to: {report_path}")
     return report_path
 
-def create_6pm_html_report(summary_df, detail_df, scatterplot_df, capacity_buckets_df):
-    """Create HTML report for 6pm historical analysis"""
-    
-    # Extract summary data
-    if not summary_df.empty:
-        high_util_count = summary_df.iloc[0]['high_utilization_carparks']
-        very_high_util_count = summary_df.iloc[0]['very_high_utilization_carparks']
-        avg_utilization = summary_df.iloc[0]['overall_avg_utilization']
-        max_utilization = summary_df.iloc[0]['max_utilization']
-        min_utilization = summary_df.iloc[0]['min_utilization']
-    else:
-        high_util_count = very_high_util_count = avg_utilization = max_utilization = min_utilization = 0
-    
-    # Convert DataFrames to HTML tables
-    summary_table = summary_df.to_html(index=False, classes='data-table') if not summary_df.empty else "<p>No data available</p>"
-    detail_table = detail_df.to_html(index=False, classes='data-table') if not detail_df.empty else "<p>No data available</p>"
-    
-    # Create scatterplot data for JavaScript
-    scatterplot_json = scatterplot_df.to_json(orient='records') if not scatterplot_df.empty else "[]"
-    
-    # Group capacity buckets data by bucket
-    capacity_buckets_html = ""
-    if not capacity_buckets_df.empty:
-        for bucket in ['Small (1-10 lots)', 'Medium (11-50 lots)', 'Large (51-100 lots)', 'Very Large (100+ lots)']:
-            bucket_data = capacity_buckets_df[capacity_buckets_df['capacity_bucket'] == bucket]
-            if not bucket_data.empty:
-                bucket_table = bucket_data[['carpark_number', 'address', 'avg_utilization_percent', 'avg_total_lots', 'data_points']].to_html(index=False, classes='data-table')
-                capacity_buckets_html += f"""
-                <div class="capacity-bucket">
-                    <h3>{bucket}</h3>
-                    {bucket_table}
-                </div>
-                """
-    
-    html_content = f"""
+# Static page scaffold for the 6pm report, built once at import; only the
+# dynamic slots are filled in per report with str.format
+_6PM_REPORT_TEMPLATE = """
     <!DOCTYPE html>
     <html lang="en">
     <head>
@@ -344,7 +332,7 @@ def create_6pm_html_report(summary_df, detail_df, scatterplot_df, capacity_bucke
                 </div>
                 
                 <div class="timestamp">
-                    Report generated on {pd.Timestamp.now().strftime('%Y-%m-%d %H:%M:%S')} SGT
+                    Report generated on {current_time} SGT
                 </div>
             </div>
         </div>
@@ -457,11 +445,57 @@ def create_6pm_html_report(summary_df, detail_df, scatterplot_df, capacity_bucke
     </body>
     </html>
     """
+
+def create_6pm_html_report(summary_df, detail_df, scatterplot_df, capacity_buckets_df):
+    """Create HTML report for 6pm historical analysis"""
+    
+    # Extract summary data
+    if not summary_df.empty:
+        row = summary_df.iloc[0]
+        high_util_count = int(row['high_utilization_carparks'])
+        very_high_util_count = int(row['very_high_utilization_carparks'])
+        avg_utilization = row['overall_avg_utilization']
+        max_utilization = row['max_utilization']
+        min_utilization = row['min_utilization']
+    else:
+        high_util_count = very_high_util_count = avg_utilization = max_utilization = min_utilization = 0
+    
+    # Convert DataFrames to HTML tables
+    summary_table = summary_df.to_html(index=False, classes='data-table') if not summary_df.empty else "<p>No data available</p>"
+    detail_table = detail_df.to_html(index=False, classes='data-table') if not detail_df.empty else "<p>No data available</p>"
+    
+    # Create scatterplot data for JavaScript
+    scatterplot_json = scatterplot_df.to_json(orient='records') if not scatterplot_df.empty else "[]"
+    
+    # One table per capacity bucket; the rows already come in bucket order, so a
+    # single unsorted groupby splits them and the sections are joined once
+    bucket_columns = ['carpark_number', 'address', 'avg_utilization_percent', 'avg_total_lots', 'data_points']
+    capacity_buckets_html = "".join(
+        f"""
+                <div class="capacity-bucket">
+                    <h3>{bucket}</h3>
+                    {bucket_data[bucket_columns].to_html(index=False, classes='data-table')}
+                </div>
+                """
+        for bucket, bucket_data in capacity_buckets_df.groupby('capacity_bucket', sort=False)
+    )
+    
+    html_content = _6PM_REPORT_TEMPLATE.format(
+        high_util_count=high_util_count,
+        very_high_util_count=very_high_util_count,
+        avg_utilization=avg_utilization,
+        max_utilization=max_utilization,
+        summary_table=summary_table,
+        detail_table=detail_table,
+        capacity_buckets_html=capacity_buckets_html,
+        current_time=datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+        scatterplot_json=scatterplot_json
+    )
     
     return html_content
 
 @flow(name="Historical 6PM Utilization Analysis")
-def historical_6pm_pipeline(force_full_refresh=False):
+def historical_6pm_pipeline(force_full_refresh=False, reference_loaded=False):
     """
     Pipeline to answer: How many HDB carparks with electronic parking are 
     utilised at ≥80% capacity on average at approximately 6pm this month?
@@ -475,34 +509,60 @@ def historical_6pm_pipeline(force_full_refresh=False):
     6. Identifies carparks with high utilization (≥80% capacity)
     
     Args:
-        force_full_refresh: If True, ignores existing data and fetches full 30 days
+        force_full_refresh: If True, re-fetches all 30 days instead of only missing
+                            dates; rows are still upserted, so unchanged ones stay put
+        reference_loaded: True if the caller already loaded ref_carpark_info this
+                          run; otherwise this pipeline extracts and loads it itself
     """
     print("🌆 Starting Historical 6PM Utilization Pipeline with Delta Loading...")
     
     if force_full_refresh:
         print("⚠️  Force full refresh mode enabled - will fetch all 30 days")
     
-    # Extract data (delta loading by default)
-    historical_data = extract_6pm_historical_data(force_full_refresh)
-    reference_data = extract_carpark_reference_info()
+    # The historical and reference branches are independent, so both run
+    # concurrently and each transform+load is submitted as soon as its own
+    # extract is in (results are unwrapped first so they can be passed quoted)
     
-    # Transform data
-    historical_records = transform_6pm_historical_data(quote(historical_data))
-    reference_records = transform_reference_info(quote(reference_data))
+    # Extract data (delta loading by default; reference info only if the caller
+    # hasn't loaded it already)
+    load_reference = not reference_loaded
+    historical_future = extract_6pm_historical_data.submit(force_full_refresh)
+    extract_futures = [historical_future]
+    if load_reference:
+        extract_futures.append(extract_carpark_reference_info.submit())
     
-    # Load data with delta loading (unless force_full_refresh is True)
-    print(f"Loading {len(historical_records)} historical records with delta loading: {not force_full_refresh}")
-    load_6pm_historical_data(quote(historical_records), use_delta_loading=not force_full_refresh)
-    load_reference_info(quote(reference_records))
+    # Transform and load data with delta loading; a full refresh re-fetches every
+    # date but upserts too, so the table is never emptied and rewritten
+    load_futures = []
+    for extract_future in as_completed(extract_futures):
+        if extract_future is historical_future:
+            load_futures.append(transform_and_load_6pm_historical_data.submit(quote(extract_future.result())))
+        else:
+            reference_data, reference_sync_state = extract_future.result()
+            load_futures.append(transform_and_load_reference_info.submit(quote(reference_data), reference_sync_state))
+    for load_future in load_futures:
+        load_future.result()
     
     # Clean up old data
     cleanup_old_data()
     
-    # Analyze and report
-    summary_results, detail_results = analyze_6pm_high_utilization()
+    # Aggregate the 30-day window once for all report queries. Always refreshed:
+    # the window moves with the date and the reference data can be reloaded by
+    # the other pipeline, and the view is small
+    refresh_6pm_utilization_view()
+    
+    # Analyze and get the visualization data (independent reads of the view)
+    analysis_future = analyze_6pm_high_utilization.submit()
+    scatterplot_future = get_scatterplot_data.submit()
+    capacity_buckets_future = get_capacity_buckets.submit()
+    summary_results, detail_results = analysis_future.result()
+    scatterplot_data = scatterplot_future.result()
+    capacity_buckets_data = capacity_buckets_future.result()
     
     # Generate HTML report
-    report_path = generate_6pm_html_report(summary_results, detail_results)
+    report_path = generate_6pm_html_report(
+        quote(summary_results), quote(detail_results), quote(scatterplot_data), quote(capacity_buckets_data)
+    )
     
     print("✅ Historical 6PM Utilization Pipeline completed!")
     print(f"📊 HTML Report available at: {report_path}")
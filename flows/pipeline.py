@@ -10,10 +10,25 @@ This is the main orchestrator pipeline that runs both business question analyses
 The pipeline can run both analyses together or individually based on user needs.
 """
 
-from prefect import flow
-from flows.current_occupancy_pipeline import current_occupancy_pipeline
+from prefect import flow, task
+from prefect.utilities.annotations import quote
+from flows.current_occupancy_pipeline import current_occupancy_pipeline, extract_carpark_reference_info, transform_and_load_reference_info
 from flows.historical_6pm_pipeline import historical_6pm_pipeline
 
+# Once the shared reference data is loaded, the two analyses are otherwise
+# independent, so each subflow runs inside its own task and both are submitted
+# together; their API fetches and loads overlap
+
+@task(persist_result=False)
+def run_current_occupancy_analysis(reference_loaded=False):
+    """Run the current occupancy subflow"""
+    return current_occupancy_pipeline(reference_loaded=reference_loaded)
+
+@task(persist_result=False)
+def run_historical_6pm_analysis(reference_loaded=False):
+    """Run the historical 6pm utilization subflow"""
+    return historical_6pm_pipeline(reference_loaded=reference_loaded)
+
 @flow(name="Complete HDB Carpark Analysis")
 def complete_analysis_pipeline():
     """
@@ -24,17 +39,18 @@ def complete_analysis_pipeline():
     print("🚀 Starting Complete HDB Carpark Analysis Pipeline...")
     print("=" * 70)
     
-    # Run current occupancy analysis
-    print("\n📊 Phase 1: Current Occupancy Analysis")
-    print("-" * 40)
-    current_results = current_occupancy_pipeline()
-    
-    print("\n" + "=" * 70)
+    # Both analyses read the same carpark reference data, so it is fetched and
+    # loaded once here instead of by each of them
+    reference_data, reference_sync_state = extract_carpark_reference_info()
+    transform_and_load_reference_info(quote(reference_data), reference_sync_state)
     
-    # Run historical 6pm utilization analysis  
-    print("\n🌆 Phase 2: Historical 6PM Utilization Analysis")
-    print("-" * 50)
-    historical_summary, historical_details = historical_6pm_pipeline()
+    # Run current occupancy and historical 6pm utilization analyses concurrently
+    print("\n📊 Current Occupancy Analysis + 🌆 Historical 6PM Utilization Analysis")
+    print("-" * 70)
+    current_future = run_current_occupancy_analysis.submit(reference_loaded=True)
+    historical_future = run_historical_6pm_analysis.submit(reference_loaded=True)
+    current_results = current_future.result()
+    historical_summary, historical_details = historical_future.result()
     
     print("\n" + "=" * 70)
     print("✅ Complete HDB Carpark Analysis Pipeline finished!")
@@ -5,10 +5,82 @@ CREATE TABLE IF NOT EXISTS raw_carpark_current_availability (
   total_lots         INTEGER,
   lot_type           TEXT,
   available_lots     INTEGER,
+  update_datetime_sg TIMESTAMP
+);
+
+-- The raw API payload is per carpark, so it is stored once per carpark snapshot
+-- here rather than repeated on every lot-type row of the availability table.
+CREATE TABLE IF NOT EXISTS raw_carpark_current_payload (
+  ingest_ts_sgt      TIMESTAMP NOT NULL,
+  carpark_number     TEXT NOT NULL,
   update_datetime_sg TIMESTAMP,
   payload_json       JSONB NOT NULL
 );
 
+-- One payload per carpark snapshot. Tables created before this key existed may
+-- hold repeats from earlier runs; keep the first ingest of each before indexing.
+DO $$
+BEGIN
+  IF to_regclass('uq_raw_curr_payload_snapshot') IS NULL THEN
+    DELETE FROM raw_carpark_current_payload a
+    USING raw_carpark_current_payload b
+    WHERE a.carpark_number = b.carpark_number
+      AND a.update_datetime_sg = b.update_datetime_sg
+      AND (a.ingest_ts_sgt, a.ctid) > (b.ingest_ts_sgt, b.ctid);
+  END IF;
+END $$;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_raw_curr_payload_snapshot
+  ON raw_carpark_current_payload (carpark_number, update_datetime_sg);
+
+-- Databases created before the split still keep payload_json on the
+-- availability table; move those payloads over before dropping the column.
+DO $$
+BEGIN
+  IF EXISTS (
+    SELECT 1 FROM information_schema.columns
+    WHERE table_schema = current_schema()
+      AND table_name = 'raw_carpark_current_availability'
+      AND column_name = 'payload_json'
+  ) THEN
+    INSERT INTO raw_carpark_current_payload
+      (ingest_ts_sgt, carpark_number, update_datetime_sg, payload_json)
+    SELECT DISTINCT ON (carpark_number, update_datetime_sg)
+        ingest_ts_sgt, carpark_number, update_datetime_sg, payload_json
+    FROM raw_carpark_current_availability
+    WHERE payload_json IS NOT NULL
+    ORDER BY carpark_number, update_datetime_sg, ingest_ts_sgt
+    ON CONFLICT (carpark_number, update_datetime_sg) DO NOTHING;
+    
+    ALTER TABLE raw_carpark_current_availability DROP COLUMN payload_json;
+  END IF;
+END $$;
+
+-- Lets DISTINCT ON (carpark_number, lot_type) ... ORDER BY ingest_ts_sgt DESC
+-- walk the index for the latest reading instead of sorting all history. Partial
+-- on the filters the latest-availability view uses, and covering the lot counts so
+-- its refresh can be an index-only scan.
+DROP INDEX IF EXISTS idx_raw_curr_avail_latest;
+CREATE INDEX IF NOT EXISTS idx_raw_curr_latest
+  ON raw_carpark_current_availability (carpark_number, lot_type, ingest_ts_sgt DESC)
+  INCLUDE (total_lots, available_lots)
+  WHERE total_lots IS NOT NULL AND available_lots IS NOT NULL AND total_lots > 0;
+
+-- Latest usable reading per carpark and lot type. Shared by the current occupancy
+-- and map queries; refreshed once per current occupancy pipeline run.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_carpark_latest_availability AS
+SELECT DISTINCT ON (carpark_number, lot_type)
+    carpark_number, lot_type, total_lots, available_lots, ingest_ts_sgt
+FROM raw_carpark_current_availability
+WHERE total_lots IS NOT NULL 
+  AND available_lots IS NOT NULL
+  AND total_lots > 0
+ORDER BY carpark_number, lot_type, ingest_ts_sgt DESC;
+
+-- Required by REFRESH MATERIALIZED VIEW CONCURRENTLY
+CREATE UNIQUE INDEX IF NOT EXISTS idx_mv_latest_avail_key
+  ON mv_carpark_latest_availability (carpark_number, lot_type);
+
 CREATE TABLE IF NOT EXISTS ref_carpark_info (
   car_park_no            TEXT PRIMARY KEY,
   address                TEXT,
@@ -24,6 +96,15 @@ CREATE TABLE IF NOT EXISTS ref_carpark_info (
   car_park_basement      TEXT
 );
 
+-- ETag and body hash of the last loaded copy of rarely-changing sources, so
+-- unchanged reference data is not re-downloaded or reloaded every run
+CREATE TABLE IF NOT EXISTS etl_sync_state (
+  source       TEXT PRIMARY KEY,
+  etag         TEXT,
+  content_hash TEXT NOT NULL,
+  updated_at   TIMESTAMP NOT NULL
+);
+
 CREATE TABLE IF NOT EXISTS raw_carpark_availability_6pm_last_30days (
   ingest_ts_sgt      TIMESTAMP NOT NULL,
   carpark_number     TEXT NOT NULL,
@@ -34,3 +115,28 @@ CREATE TABLE IF NOT EXISTS raw_carpark_availability_6pm_last_30days (
   payload_json       JSONB NOT NULL,
   PRIMARY KEY (update_datetime_sg, carpark_number)
 );
+
+-- Per-carpark 6pm utilization over the last 30 days for electronic parking.
+-- Shared by every 6pm report query; refreshed once per historical pipeline run.
+CREATE MATERIALIZED VIEW IF NOT EXISTS mv_carpark_6pm_utilization AS
+SELECT 
+    hist.carpark_number,
+    info.address,
+    AVG(
+        CASE 
+            WHEN hist.total_lots > 0 
+            THEN ((hist.total_lots - hist.available_lots)::numeric / hist.total_lots * 100)
+            ELSE 0 
+        END
+    ) as avg_utilization_percent,
+    COUNT(*) as data_points,
+    AVG(hist.total_lots) as avg_total_lots,
+    AVG(hist.available_lots) as avg_available_lots
+FROM raw_carpark_availability_6pm_last_30days hist
+INNER JOIN ref_carpark_info info ON hist.carpark_number = info.car_park_no
+WHERE hist.total_lots IS NOT NULL 
+  AND hist.available_lots IS NOT NULL
+  AND hist.total_lots > 0
+  AND info.type_of_parking_system = 'ELECTRONIC PARKING'
+  AND hist.update_datetime_sg >= CURRENT_DATE - INTERVAL '30 days' -- DATE_TRUNC('month', CURRENT_DATE) if this month only
+GROUP BY hist.carpark_number, info.address;
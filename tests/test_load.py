@@ -0,0 +1,23 @@
+import pandas as pd
+from etl.load import _copy_frame
+
+class _FakeCursor:
+    """Captures the COPY statement and the CSV it would stream"""
+    
+    def copy_expert(self, sql, buf):
+        self.sql = sql
+        self.data = buf.read()
+
+def test_copy_frame_writes_null_marker_for_missing_values():
+    df = pd.DataFrame({
+        'carpark_number': ['A1', 'A2'],
+        'lot_type': ['', None],
+        'total_lots': pd.array([100, None], dtype='Int64')
+    })
+    cur = _FakeCursor()
+    
+    _copy_frame(cur, 'some_table', ('carpark_number', 'lot_type', 'total_lots'), df)
+    
+    assert cur.sql == "COPY some_table (carpark_number, lot_type, total_lots) FROM STDIN WITH (FORMAT csv, NULL '\\N')"
+    # With NULL '\\N', an unquoted empty CSV field loads as an empty string
+    assert cur.data.splitlines() == ['A1,,100', 'A2,\\N,\\N']
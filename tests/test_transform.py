@@ -0,0 +1,78 @@
+from datetime import datetime, timedelta
+import pandas as pd
+from etl.transform import (
+    SG_TZ, LOAD_COLUMNS, _parse_sgt_timestamps, _lots_to_int,
+    transform_carpark_current_availability, transform_carpark_availability_6pm_historical
+)
+
+def _item(timestamp, carpark_number='A1', total_lots='100', lots_available='40'):
+    """One API snapshot with a single carpark and lot type"""
+    return {
+        'timestamp': timestamp,
+        'carpark_data': [{
+            'carpark_number': carpark_number,
+            'update_datetime': '2024-01-01T17:58:00',
+            'carpark_info': [{'total_lots': total_lots, 'lot_type': 'C', 'lots_available': lots_available}]
+        }]
+    }
+
+def _6pm(days_ago, hour=18):
+    """ISO timestamp for the given hour SGT some days back"""
+    day = datetime.now(SG_TZ) - timedelta(days=days_ago)
+    return day.replace(hour=hour, minute=0, second=0, microsecond=0).isoformat()
+
+def test_parse_sgt_timestamps_with_and_without_offset():
+    parsed = _parse_sgt_timestamps(pd.Series([
+        '2024-01-01T18:00:00+08:00',
+        '2024-01-01T10:00:00Z',
+        '2024-01-01T18:00:00'
+    ], dtype=object))
+    
+    expected = pd.Timestamp('2024-01-01 18:00', tz='Asia/Singapore')
+    assert list(parsed) == [expected, expected, expected]
+
+def test_parse_sgt_timestamps_invalid_becomes_nat():
+    parsed = _parse_sgt_timestamps(pd.Series(['not a timestamp', None, ''], dtype=object))
+    
+    assert parsed.isna().all()
+
+def test_lots_to_int_non_numeric_becomes_na():
+    lots = _lots_to_int(pd.Series(['12', 'abc', '', None], dtype=object))
+    
+    assert str(lots.dtype) == 'Int64'
+    assert lots.iloc[0] == 12
+    assert lots.iloc[1:].isna().all()
+
+def test_current_availability_empty_items():
+    records = transform_carpark_current_availability({'items': []})
+    
+    assert records.empty
+    assert list(records.columns) == LOAD_COLUMNS
+
+def test_current_availability_filters_stale_snapshots():
+    now = datetime.now(SG_TZ)
+    records = transform_carpark_current_availability({'items': [
+        _item(now.isoformat(), carpark_number='FRESH'),
+        _item((now - timedelta(hours=11)).isoformat(), carpark_number='STALE'),
+        _item('garbage', carpark_number='INVALID')
+    ]})
+    
+    assert list(records['carpark_number']) == ['FRESH']
+    assert records['total_lots'].iloc[0] == 100
+    assert records['available_lots'].iloc[0] == 40
+
+def test_6pm_historical_filters_old_and_non_6pm_snapshots():
+    records = transform_carpark_availability_6pm_historical({'items': [
+        _item(_6pm(1), carpark_number='KEEP'),
+        _item(_6pm(31), carpark_number='OLD'),
+        _item(_6pm(2, hour=12), carpark_number='NOON'),
+        _item(None, carpark_number='MISSING')
+    ]})
+    
+    assert list(records['carpark_number']) == ['KEEP']
+
+def test_6pm_historical_empty_items():
+    records = transform_carpark_availability_6pm_historical({'items': []})
+    
+    assert records.empty
+    assert list(records.columns) == LOAD_COLUMNS